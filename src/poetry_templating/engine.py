@@ -1,11 +1,26 @@
 from __future__ import annotations
 
+import io
 import logging
 import os
 import re
-from pathlib import Path
+import shutil
+import stat
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from re import Match, Pattern
-from typing import Callable, List, Optional, Union
+from typing import (
+    AnyStr,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from poetry.core.pyproject.toml import PyProjectTOML
 
@@ -13,18 +28,28 @@ from poetry_templating import DEFAULT_ENCODING, DEFAULT_EXCLUDE, DEFAULT_INCLUDE
 from poetry_templating.error import EvaluationError
 from poetry_templating.util import (
     StrPath,
+    compile_globs,
     get_configuration,
     get_listable,
-    matches_any,
+    glob_suffixes,
+    normalize_path,
     relative,
     traverse,
 )
 
-RE_TEMPLATE_SLOT = re.compile(r"(?:#\s*)?\${(.+)}")
+# Slots extend to the last closing brace on their line, consuming a comment before them
+RE_TEMPLATE_SLOT = re.compile(r"(?:#[^\S\n]*)?\${(.+)}")
+
+# Matches toggle lines, deleted lines and template slots in a single pass over a buffer
+RE_DIRECTIVE = re.compile(
+    r"^[^\S\n]*#[^\S\n]*templating: (on|off)[^\S\n]*(?:\n|\Z)"
+    r"|^[^\n]*#[^\S\n]*templating: delete[^\n]*(?:\n|\Z)"
+    r"|" + RE_TEMPLATE_SLOT.pattern,
+    re.IGNORECASE | re.MULTILINE,
+)
+RE_MARKER = re.compile(rb"\${|templating:", re.IGNORECASE)
 
-RE_DISABLE = re.compile(r"^\s*#\s*templating: off\s*$", re.IGNORECASE)
-RE_ENABLE = re.compile(r"^\s*#\s*templating: on\s*$", re.IGNORECASE)
-RE_DELETE = re.compile(r"#\s*templating: delete", re.IGNORECASE)
+CHUNK_SIZE = 1 << 16  # Size of blocks read when scanning files for markers
 
 _log = logging.getLogger(__name__)
 
@@ -40,9 +65,12 @@ class TemplatingEngine:
         pyproject : PyProjectTOML
             The pyproject.toml of the parent package.
         """
-        self.processed: List[str] = []
+        self.processed: Set[str] = set()
+        self.evaluating: Set[str] = set()
+        self.cache: Dict[Tuple[str, int, int], str] = {}
+        self.static_slots: Dict[str, str] = {}
         self.pyproject: PyProjectTOML = pyproject
-        self.root = os.path.dirname(pyproject.path)
+        self.root = os.path.realpath(os.path.dirname(pyproject.path))
 
         # Get configuration
         configuration = get_configuration(pyproject)
@@ -50,128 +78,330 @@ class TemplatingEngine:
         self.include = get_listable(configuration, "include", DEFAULT_INCLUDE)
         self.exclude = get_listable(configuration, "exclude", DEFAULT_EXCLUDE)
 
-    def relative(self, path: StrPath) -> Path:
+        # Compile glob patterns once rather than for every file checked
+        self._include_pattern = compile_globs(self.include)
+        self._exclude_pattern = compile_globs(self.exclude)
+
+        # Extension patterns, such as the default, only need a suffix check
+        self._include_suffixes = glob_suffixes(self.include)
+        self._matched: Dict[str, bool] = {}
+
+        self._raw_markers = "${templating:".encode(self.encoding) == b"${templating:"
+
+    def relative(self, path: StrPath) -> str:
         return relative(path, self.root)
 
     def set_processed(self, path: StrPath) -> None:
-        rel = self.relative(path)
-        self.processed.append(rel.as_posix())
+        self.processed.add(self.relative(path))
 
     def should_process(self, path: StrPath) -> bool:
-        rel = self.relative(path)
-        return (
-            rel.as_posix() not in self.processed
-            and matches_any(rel, self.include)
-            and not matches_any(rel, self.exclude)
-        )
+        return self._should_process(self.relative(path))
+
+    def _should_process(self, rel: str) -> bool:
+        if rel in self.processed:
+            return False
+
+        # Files can be checked many times, but patterns never change
+        matched = self._matched.get(rel)
+        if matched is None:
+            matched = self._matched[rel] = self._matches(rel)
+        return matched
+
+    def _matches(self, rel: str) -> bool:
+        normalized = normalize_path(rel)
+        if self._include_suffixes is not None:
+            included = normalized.endswith(self._include_suffixes)
+        else:
+            included = self._include_pattern.match(normalized) is not None
+        return included and self._exclude_pattern.match(normalized) is None
+
+    def has_markers(self, path: StrPath) -> bool:
+        # Markers can only be found in the raw bytes of ASCII compatible encodings
+        if not self._raw_markers:
+            return True
+
+        overlap = len("templating")
+        tail = b""
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                # Markers may span two chunks, so the boundary is searched separately
+                # rather than copying each chunk onto the end of the previous one
+                if (
+                    RE_MARKER.search(chunk) is not None
+                    or RE_MARKER.search(tail + chunk[:overlap]) is not None
+                ):
+                    return True
+                tail = chunk[-overlap:]
+        return False
+
+    def walk(
+        self, directory: Optional[str] = None, prefix: str = ""
+    ) -> Iterator[Tuple[str, str]]:
+        """Walks the project directory, yielding the absolute and relative path of every file."""
+        try:
+            entries = os.scandir(directory or self.root)
+        except OSError:
+            return  # Unreadable directories are skipped, as with os.walk
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        yield from self.walk(entry.path, prefix + entry.name + os.sep)
+                elif entry.is_symlink():
+                    # Linked files are identified and replaced by their target
+                    target = os.path.realpath(entry.path)
+                    yield target, self.relative(target)
+                else:
+                    # Relative paths of real files are built without resolving them
+                    yield entry.path, prefix + entry.name
 
     def evaluate_and_replace(self) -> int:
         count = 0
-        for path in (os.path.join(p, f) for p, _, fs in os.walk(self.root) for f in fs):
-            if self.should_process(path):
+        files = [(path, rel) for path, rel in self.walk() if self._should_process(rel)]
+
+        # Scanning for markers is bound by IO, so is done ahead of evaluation in threads
+        with ThreadPoolExecutor() as executor:
+            markers = executor.map(self.has_markers, [path for path, _ in files])
+            for (path, rel), marked in zip(files, markers):
+                # Files may have been processed while evaluating an earlier file
+                if rel in self.processed:
+                    continue
+
                 count += 1
-                result = ""
-                ctx = EvaluationContext(path, self)
-                with open(path, "r+") as file:
-                    for line in file:
-                        evaluated = ctx.evaluate_line(line)
-                        if evaluated is not None:
-                            result += evaluated
-                    file.seek(0)
-                    file.write(result)
-                    file.truncate()
-                self.set_processed(path)
+                # Files without any slots or directives are left untouched
+                if marked:
+                    self.evaluating.add(rel)
+                    try:
+                        self.replace_file(path, rel)
+                    finally:
+                        self.evaluating.discard(rel)
+                self.processed.add(rel)
 
         return count
 
+    def replace_file(self, path: str, rel: str) -> None:
+        # Output is written next to the file, then moved over it once complete
+        fd, temp = tempfile.mkstemp(prefix=".templating-", dir=os.path.dirname(path))
+        try:
+            with open(fd, "wb") as result, open(path, "rb") as file:
+                EvaluationContext(rel, self).evaluate_stream(file, result)
+            shutil.copymode(path, temp)
+            os.replace(temp, path)
+        except BaseException:
+            os.remove(temp)
+            raise
+
     def evaluate_string(
         self,
         data: str,
         location: Optional[StrPath] = None,
     ) -> str:
-        result: List[str] = []
-        ctx = EvaluationContext(location, self)
-        for line in data.split("\n"):
-            evaluated = ctx.evaluate_line(line)
-            if evaluated is not None:
-                result.append(evaluated)
+        if location is None:
+            return EvaluationContext(None, self).evaluate(data)
 
-        if location is not None:
-            self.set_processed(location)
+        # Files being evaluated are tracked so that circular inclusions can be detected
+        rel = self.relative(location)
+        self.evaluating.add(rel)
+        try:
+            result = EvaluationContext(rel, self).evaluate(data)
+        finally:
+            self.evaluating.discard(rel)
+
+        self.processed.add(rel)
+        return result
 
-        return "\n".join(result)
+
+def _split_break(line: AnyStr) -> Tuple[AnyStr, AnyStr]:
+    # Lines are either text or raw bytes, depending on how they are streamed
+    end = len(line)
+    if line[-1:] in ("\n", b"\n"):
+        end -= 2 if line[-2:-1] in ("\r", b"\r") else 1
+    return line[:end], line[end:]
 
 
 class EvaluationContext:
+    __slots__ = (
+        "location",
+        "directory",
+        "engine",
+        "enabled",
+        "line",
+        "_slot_cache",
+        "_drop_break",
+    )
+
     def __init__(
         self,
-        location: Optional[StrPath],
+        location: Optional[str],
         engine: TemplatingEngine,
     ) -> None:
-        self.location = location and engine.relative(location)
+        self.location = location
         self.engine = engine
         self.enabled = True
-        self.line = -1
-
-    def evaluate_line(self, data: str) -> Union[str, None]:
-        self.line += 1
-
-        # Check for on/off comment
-        if RE_DISABLE.match(data):
-            self.enabled = False
-            return None
-        if RE_ENABLE.match(data):
-            self.enabled = True
-            return None
-
-        # Process line
-        if self.enabled:
-            # Skip if ends with delete comment
-            if RE_DELETE.search(data):
-                return None
-
-            return self.evaluate_string(data)
-        else:
-            return data
+        self.line = 0
+        self._slot_cache: Dict[str, str] = {}
+        self._drop_break = False  # Whether the line break before a streamed line is removed
+
+        # Relative file slots are resolved from the directory containing the location
+        self.directory: Optional[str] = None
+        if location is not None:
+            self.directory = os.path.join(engine.root, os.path.dirname(location))
+
+    def evaluate(self, data: str) -> str:
+        result: List[str] = []
+        last = 0
+        counted = 0
+        unterminated = False
+        for match in RE_DIRECTIVE.finditer(data):
+            toggle, content = match.groups()
+            if toggle is None and not self.enabled:
+                continue  # Slots and deletions are left as they are while disabled
+
+            result.append(data[last : match.start()])
+            last = match.end()
+
+            if content is None and last == len(data) and data[last - 1 : last] != "\n":
+                unterminated = True  # A directive ended the input without a line break
+
+            if toggle is not None:
+                self.enabled = toggle.lower() == "on"
+            elif content is not None:
+                # Line numbers are only needed for errors, so are counted lazily
+                self.line += data.count("\n", counted, match.start())
+                counted = match.start()
+                result.append(self._evaluate_slot(content))
+
+        self.line += data.count("\n", counted)
+        result.append(data[last:])
+        output = "".join(result)
+
+        if unterminated:
+            # The directive's line is removed along with the line break before it
+            output, line_break = _split_break(output)
+            if not line_break:
+                self._drop_break = True  # The line break is held back by evaluate_stream
+        return output
+
+    def evaluate_stream(self, source: BinaryIO, target: BinaryIO) -> None:
+        encoding = self.engine.encoding
+
+        if not self.engine._raw_markers:
+            # Lines of other encodings can only be split once decoded
+            reader = io.TextIOWrapper(source, encoding, newline="")
+            writer = io.TextIOWrapper(target, encoding, newline="")
+            held = ""
+            for line in reader:
+                # Line breaks are held back in case the next line is a final directive
+                output, line_break = _split_break(self.evaluate(line))
+                writer.write(output if self._drop_break else held + output)
+                held = line_break
+            writer.write(held)
+            writer.flush()
+            writer.detach()
+            reader.detach()
+            return
+
+        held = b""
+        for line in source:
+            # Lines without any markers are never changed, so are not decoded
+            if RE_MARKER.search(line) is None:
+                self.line += 1
+            else:
+                line = self.evaluate(line.decode(encoding)).encode(encoding)
+
+            line, line_break = _split_break(line)
+            target.write(line if self._drop_break else held + line)
+            held = line_break
+        target.write(held)
 
     def evaluate_string(self, data: str) -> str:
-        return RE_TEMPLATE_SLOT.sub(self._evaluate_slot, data)
+        # Skip the regex engine entirely when there cannot be a slot
+        if "${" not in data:
+            return data
 
-    def _evaluate_slot(self, match: re.Match) -> str:
-        content = match.group(1)
-        for construct in Construct.constructs:
-            check = construct.pattern.match(content)
-            if check is not None:
-                try:
-                    return construct.handler(check, self)
-                except Exception as e:
-                    if isinstance(e, EvaluationError):
-                        raise
-                    raise EvaluationError(self, e) from e  # pragma: no cover
-        raise EvaluationError(self, "Unknown Construct")
+        result: List[str] = []
+        last = 0
+        for match in RE_TEMPLATE_SLOT.finditer(data):
+            result.append(data[last : match.start()])
+            result.append(self._evaluate_slot(match.group(1)))
+            last = match.end()
+
+        result.append(data[last:])
+        return "".join(result)
+
+    def _evaluate_slot(self, content: str) -> str:
+        # Slots of static constructs only need to be evaluated once per engine
+        result = self.engine.static_slots.get(content)
+        if result is not None:
+            return result
+
+        # Other slots may also depend on the location, so are only reused in this context
+        result = self._slot_cache.get(content)
+        if result is not None:
+            return result
+
+        found = Construct.find(content)
+        if found is None:
+            raise EvaluationError(self, "Unknown Construct")
+
+        construct, check = found
+        try:
+            result = construct.handler(check, self)
+        except Exception as e:
+            if isinstance(e, EvaluationError):
+                raise
+            raise EvaluationError(self, e) from e  # pragma: no cover
+
+        if construct.static:
+            self.engine.static_slots[content] = result
+        else:
+            self._slot_cache[content] = result
+        return result
 
 
 class Construct:
     constructs: List["Construct"] = []
 
+    __slots__ = ("handler", "pattern", "fullmatch", "static", "initials")
+
     def __init__(
         self,
         pattern: Pattern,
         handler: Callable[[Match, EvaluationContext], str],
+        static: bool = False,
+        initials: Optional[str] = None,
     ) -> None:
         Construct.constructs.append(self)
         self.handler = handler
         self.pattern = pattern
+        self.fullmatch = pattern.fullmatch  # Patterns must match the entire slot content
+        self.static = static  # Whether the result only depends on the slot content
+        self.initials = initials  # Characters a match can start with, any if None
+
+    @staticmethod
+    def find(content: str) -> Optional[Tuple[Construct, Match]]:
+        initial = content[:1]
+        for construct in Construct.constructs:
+            # Skip the regex entirely for constructs which cannot start with this character
+            if construct.initials is not None and initial not in construct.initials:
+                continue
+            check = construct.fullmatch(content)
+            if check is not None:
+                return construct, check
+        return None
 
     @staticmethod
     def construct(
         pattern: Union[Pattern, str],
+        static: bool = False,
+        initials: Optional[str] = None,
     ) -> Callable[[Callable[[Match, EvaluationContext], str]], Construct]:
         if isinstance(pattern, str):
             pattern = re.compile(pattern)
 
         def wrapper(func: Callable[[Match, EvaluationContext], str]) -> Construct:
-            return Construct(pattern, func)
+            return Construct(pattern, func, static, initials)
 
         return wrapper
 
@@ -179,12 +409,12 @@ class Construct:
 # Define Constructs
 
 
-@Construct.construct("^[\"'](.+)[\"']$")
+@Construct.construct("[\"'](.+)[\"']", initials="\"'")
 def literal_construct(match: Match, ctx: EvaluationContext) -> str:
     return ctx.evaluate_string(match.group(1))
 
 
-@Construct.construct(r"^pyproject((?:\.[^.]+)+)?$")
+@Construct.construct(r"pyproject((?:\.[^.]+)+)?", static=True, initials="p")
 def pyproject_construct(match: Match, ctx: EvaluationContext) -> str:
     path = match.group(1)
 
@@ -195,28 +425,43 @@ def pyproject_construct(match: Match, ctx: EvaluationContext) -> str:
     return str(result)
 
 
-@Construct.construct(r"^(\.?(?:\/.+)+)$")
+@Construct.construct(r"(\.?(?:\/.+)+)", initials="./")
 def file_construct(match: Match, ctx: EvaluationContext) -> str:
     path: str = match.group(1)
 
     if path.startswith("/"):
         path = os.path.join(ctx.engine.root, path[1:])
     else:
-        if ctx.location is None:
+        if ctx.directory is None:
             raise EvaluationError(ctx, "Relative paths are not permitted in this context")
-        path = os.path.join(ctx.engine.root, os.path.dirname(ctx.location), path)
-
-    if not os.path.isfile(path):
+        path = os.path.join(ctx.directory, path)
+
+    # A single stat both checks the file exists and identifies its current content
+    try:
+        info = os.stat(path)
+    except OSError:
+        info = None
+    if info is None or not stat.S_ISREG(info.st_mode):
         raise EvaluationError(ctx, f'No such file "{os.path.abspath(path)}"')
 
+    # Reuse the content of files which are included multiple times
+    key = (os.path.abspath(path), info.st_mtime_ns, info.st_size)
+    if key in ctx.engine.cache:
+        return ctx.engine.cache[key]
+
     with open(path, "r", encoding=ctx.engine.encoding) as f:
         content = f.read()
         if ctx.engine.should_process(path):
+            if ctx.engine.relative(path) in ctx.engine.evaluating:
+                raise EvaluationError(
+                    ctx, f'Circular inclusion of "{os.path.abspath(path)}"'
+                )
             content = ctx.engine.evaluate_string(content, path)
+        ctx.engine.cache[key] = content
         return content
 
 
-@Construct.construct(r"^env(?:\.([^\.\s]+))?$")
+@Construct.construct(r"env(?:\.([^\.\s]+))?", static=True, initials="e")
 def environ_construct(match: Match, ctx: EvaluationContext) -> str:
     key = match.group(1)
 
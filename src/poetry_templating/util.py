@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import fnmatch
+import functools
 import os
+import re
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Union
+from re import Pattern
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
 from poetry.core.pyproject.toml import PyProjectTOML
 
@@ -10,6 +14,9 @@ from poetry_templating import CONFIG_TABLE
 
 StrPath = Union[Path, str]
 
+RE_SUFFIX_GLOB = re.compile(r"\*(\.[^*?\[/]+)")
+RE_FNMATCH_WRAPPER = re.compile(r"\(\?s:(.*)\)\\[Zz]", re.DOTALL)
+
 
 class Mixin:
     """Represents a replacement action for an attribute of an object."""
@@ -66,23 +73,129 @@ class Mixin:
         return wrapper
 
 
-def matches_any(path: StrPath, patterns: list[str]) -> bool:
+@functools.lru_cache(maxsize=128)
+def _translate_glob(pattern: str) -> str:
+    # Components are translated separately so that wildcards never cross a separator
+    return "/".join(_translate_component(p) for p in pattern.lower().strip("/").split("/"))
+
+
+def _translate_component(component: str) -> str:
+    result: List[str] = []
+    i, n = 0, len(component)
+    while i < n:
+        c = component[i]
+        if c == "*":
+            result.append("[^/]*")
+        elif c == "?":
+            result.append("[^/]")
+        elif c == "[":
+            # Find the end of the class in the same way as fnmatch
+            j = i + 1
+            if j < n and component[j] == "!":
+                j += 1
+            if j < n and component[j] == "]":
+                j += 1
+            j = component.find("]", j)
+            if j == -1:
+                result.append(re.escape(c))
+            else:
+                # Classes are escaped by fnmatch itself, but must not match a separator
+                regex = RE_FNMATCH_WRAPPER.fullmatch(
+                    fnmatch.translate(component[i : j + 1])
+                )
+                chars = regex.group(1)  # type: ignore
+                if chars == ".":
+                    chars = "[^/]"
+                elif chars.startswith("[^]"):
+                    chars = "[^/\\]" + chars[3:]  # A leading bracket is a literal
+                elif chars.startswith("[^"):
+                    chars = "[^/" + chars[2:]
+                result.append(chars)
+                i = j
+        else:
+            result.append(re.escape(c))
+        i += 1
+
+    return "".join(result)
+
+
+def compile_globs(patterns: Iterable[str]) -> Pattern:
+    """Compiles glob patterns into a single regular expression which matches normalized paths in the same way as `PurePath.match` would for any of the patterns.
+
+    Parameters
+    ----------
+    patterns : list[str]
+        The glob patterns to compile.
+
+    Returns
+    -------
+    Pattern
+        The compiled pattern, to be matched against paths normalized with `normalize_path`.
+    """
+    alternatives = [_translate_glob(p) for p in patterns]
+    if not alternatives:
+        return re.compile("(?!)")  # Never matches
+
+    # Patterns are matched against the end of the path, aligned to a component
+    return re.compile(f"(?:.*/)?(?:{'|'.join(alternatives)})\\Z", re.DOTALL)
+
+
+def glob_suffixes(patterns: Iterable[str]) -> Optional[Tuple[str, ...]]:
+    """Gets the file extensions matched by glob patterns if they only match by extension, such as `*.py`.
+
+    Parameters
+    ----------
+    patterns : list[str]
+        The glob patterns to check.
+
+    Returns
+    -------
+    tuple[str, ...] | None
+        The lowercase suffixes matched by the patterns, or None if any pattern is more complex.
+    """
+    suffixes: List[str] = []
+    for pattern in patterns:
+        match = RE_SUFFIX_GLOB.fullmatch(pattern.lower().strip("/"))
+        if match is None:
+            return None
+        suffixes.append(match.group(1))
+    return tuple(suffixes)
+
+
+def normalize_path(path: StrPath) -> str:
+    """Normalizes a path for matching against patterns compiled with `compile_globs`.
+
+    Parameters
+    ----------
+    path : Path
+        The path to normalize.
+
+    Returns
+    -------
+    str
+        The lowercase posix form of the path.
+    """
+    return os.fspath(path).replace(os.sep, "/").lower()
+
+
+def matches_any(path: StrPath, patterns: Union[Iterable[str], Pattern]) -> bool:
     """Checks if the specified path matches any of the provided patterns.
 
     Parameters
     ----------
     path : Path
         The path to check against.
-    patterns : list[str]
-        A list of glob patterns to check against the path.
+    patterns : list[str] | Pattern
+        A list of glob patterns, or patterns compiled with `compile_globs`, to check against the path.
 
     Returns
     -------
     bool
         True if any of the patterns matched against the path.
     """
-    normalized = Path(Path(path).as_posix().lower())
-    return any(normalized.match(p.lower().strip("/")) for p in patterns)
+    if not isinstance(patterns, Pattern):
+        patterns = compile_globs(patterns)
+    return patterns.match(normalize_path(path)) is not None
 
 
 def get_configuration(pyproject: PyProjectTOML) -> dict:
@@ -132,9 +245,11 @@ def get_listable(dict: dict, key: str, default: list = []) -> list:
     return value
 
 
-def relative(path: StrPath, root: StrPath) -> Path:
+def relative(path: StrPath, root: StrPath) -> str:
     """Attempts to generate a relative path from the provided root. An absolute path will be returned if `path` is not a subpath of `root`.
 
+    Symbolic links are not resolved, so paths should be given in the same form as `root`.
+
     Parameters
     ----------
     path : Path
@@ -144,14 +259,19 @@ def relative(path: StrPath, root: StrPath) -> Path:
 
     Returns
     -------
-    Path
-        The resolved, relative path.
+    str
+        The normalized, relative path.
     """
-    resolved = Path(os.path.realpath(path))
+    resolved = os.path.abspath(path)
     try:
-        return resolved.relative_to(root)
-    except ValueError:
+        rel = os.path.relpath(resolved, root)
+    except ValueError:  # pragma: no cover
+        # Path is on a different drive to root
+        return resolved
+
+    if rel == os.pardir or rel.startswith(os.pardir + os.sep):
         return resolved
+    return rel
 
 
 def traverse(
@@ -188,23 +308,26 @@ def traverse(
 
     current = structure
     for i, step in enumerate(path):
-        if isinstance(current, dict):  # Handle dictionaries
-            if step not in current:
-                raise KeyError(f"{'.'.join(path[:i + 1])} does not exist")
-            current = current[step]
-        elif isinstance(current, list):  # Handle lists
-            try:
-                index = int(step)
-            except ValueError:
-                raise ValueError(f"'{step}' is not a valid list index")
-
-            if index >= len(current):
-                raise IndexError(
-                    f"{index} is out of range for list at {'.'.join(path[:i])}"
-                )
+        # Dictionaries are by far the most common, so are indexed without checking first
+        try:
+            current = current[step]  # type: ignore
+            continue
+        except KeyError:
+            raise KeyError(f"{'.'.join(path[:i + 1])} does not exist")
+        except TypeError:
+            pass
+
+        if not isinstance(current, list):
+            raise ValueError(f"Expected list or dictionary at {'.'.join(path[:i])}")
+
+        try:
+            index = int(step)
+        except ValueError:
+            raise ValueError(f"'{step}' is not a valid list index")
 
+        try:
             current = current[index]
-        else:
-            raise ValueError(f"Expected list or dictionary at {'.'.join(path[:i])}")
+        except IndexError:
+            raise IndexError(f"{index} is out of range for list at {'.'.join(path[:i])}")
 
     return current
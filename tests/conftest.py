@@ -21,14 +21,15 @@ build-backend = "poetry.core.masonry.api"
 """
 
 
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: builds a package with poetry")
+
+
 @pytest.fixture
-def temp_file():
-    fd, path = tempfile.mkstemp()
-    try:
-        with os.fdopen(fd, "w+") as f:
-            yield f, path
-    finally:
-        os.remove(path)
+def temp_file(tmp_path):
+    path = tmp_path / "temp"
+    with path.open("w+") as f:
+        yield f, str(path)
 
 
 @pytest.fixture
@@ -41,13 +42,25 @@ def pyproject_path(temp_file):
     yield path
 
 
+@pytest.fixture(scope="session")
+def readonly_pyproject_path(tmp_path_factory):
+    # Shared between tests, so must never be modified
+    path = tmp_path_factory.mktemp("readonly") / "pyproject.toml"
+    path.write_text(BASIC_PYPROJECT_TOML)
+    return str(path)
+
+
+def create_project(directory: str) -> None:
+    with open(os.path.join(directory, "pyproject.toml"), "w") as f:
+        f.write(BASIC_PYPROJECT_TOML)
+
+    os.mkdir(os.path.join(directory, "example"))
+    with open(os.path.join(directory, "example", "__init__.py"), "w") as f:
+        f.write("${'Success!'}")
+
+
 @pytest.fixture
 def project_path():
     with tempfile.TemporaryDirectory() as tmpdir:
-        with open(os.path.join(tmpdir, "pyproject.toml"), "w") as f:
-            f.write(BASIC_PYPROJECT_TOML)
-
-        os.mkdir(os.path.join(tmpdir, "example"))
-        with open(os.path.join(tmpdir, "example", "__init__.py"), "w") as f:
-            f.write("${'Success!'}")
+        create_project(tmpdir)
         yield tmpdir
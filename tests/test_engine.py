@@ -1,10 +1,11 @@
 import os
+import re
 import uuid
 from pathlib import Path
 
 import pytest
 from poetry.core.pyproject.toml import PyProjectTOML
-from poetry_templating.engine import TemplatingEngine
+from poetry_templating.engine import CHUNK_SIZE, Construct, TemplatingEngine
 from poetry_templating.error import EvaluationError
 
 from tests.conftest import BASIC_PYPROJECT_TOML
@@ -19,10 +20,84 @@ def temp_engine(project_path):
 def test_evaluate_and_replace(temp_engine):
     temp_engine.evaluate_and_replace()
 
-    with open(os.path.join(temp_engine.root, "example", "__init__.py"), "r") as f:
+    assert (Path(temp_engine.root) / "example" / "__init__.py").read_text() == "Success!"
+
+
+@pytest.mark.skipif(os.name == "nt", reason="symlinks require privileges")
+def test_evaluate_and_replace_symlink(temp_engine):
+    link = os.path.join(temp_engine.root, "example", "link.py")
+    os.symlink("__init__.py", link)
+    assert temp_engine.evaluate_and_replace() == 1
+
+    assert os.path.islink(link)
+    with open(link, "r") as f:
         assert f.read() == "Success!"
 
 
+@pytest.mark.skipif(os.name == "nt", reason="permission bits are not supported")
+def test_evaluate_and_replace_mode(temp_engine):
+    path = os.path.join(temp_engine.root, "example", "__init__.py")
+    os.chmod(path, 0o755)
+
+    temp_engine.evaluate_and_replace()
+
+    assert os.stat(path).st_mode & 0o777 == 0o755
+    assert os.listdir(os.path.dirname(path)) == ["__init__.py"]
+
+
+def test_evaluate_and_replace_untouched(temp_engine):
+    path = os.path.join(temp_engine.root, "example", "plain.py")
+    with open(path, "w") as f:
+        f.write("plain = True\n")
+    os.utime(path, ns=(0, 0))
+
+    temp_engine.evaluate_and_replace()
+
+    assert os.stat(path).st_mtime_ns == 0
+
+
+def test_evaluate_and_replace_split_marker(temp_engine):
+    path = os.path.join(temp_engine.root, "example", "__init__.py")
+    with open(path, "w") as f:
+        f.write("\n" * (CHUNK_SIZE - 1) + "${'Success!'}")
+
+    temp_engine.evaluate_and_replace()
+
+    with open(path, "r") as f:
+        assert f.read() == "\n" * (CHUNK_SIZE - 1) + "Success!"
+
+
+def test_evaluate_and_replace_encoding(project_path):
+    with open(os.path.join(project_path, "pyproject.toml"), "a") as f:
+        f.write('\n[tool.poetry-templating]\nencoding = "utf-16"\n')
+
+    path = os.path.join(project_path, "example", "__init__.py")
+    with open(path, "w", encoding="utf-16") as f:
+        f.write("first\n${'Success!'}\n")
+
+    pyproject = PyProjectTOML(Path(project_path) / "pyproject.toml")
+    TemplatingEngine(pyproject).evaluate_and_replace()
+
+    with open(path, "r", encoding="utf-16") as f:
+        assert f.read() == "first\nSuccess!\n"
+
+
+@pytest.mark.parametrize("encoding", ["utf-8", "utf-16"])
+def test_evaluate_and_replace_last_directive(encoding, project_path):
+    with open(os.path.join(project_path, "pyproject.toml"), "a") as f:
+        f.write(f'\n[tool.poetry-templating]\nencoding = "{encoding}"\n')
+
+    path = os.path.join(project_path, "example", "__init__.py")
+    with open(path, "w", encoding=encoding, newline="") as f:
+        f.write("${'first'}\r\nsecond\nthird # templating: delete")
+
+    pyproject = PyProjectTOML(Path(project_path) / "pyproject.toml")
+    TemplatingEngine(pyproject).evaluate_and_replace()
+
+    with open(path, "r", encoding=encoding, newline="") as f:
+        assert f.read() == "first\r\nsecond"
+
+
 @pytest.mark.parametrize(
     "include, exclude, path, result",
     [
@@ -30,6 +105,18 @@ def test_evaluate_and_replace(temp_engine):
         ('"*.py"', '"test.py"', "test.py", False),
         ('"test.py"', '"test.py"', "test.py", False),
         ('"*.py"', "[]", "random.txt", False),
+        ('"*.py"', "[]", "src/TEST.PY", True),
+        ('["*.py", "*.txt"]', '"test.py"', "random.txt", True),
+        ('["src/*.py"]', "[]", "src/test.py", True),
+    ],
+    ids=[
+        "included",
+        "excluded",
+        "exclude-priority",
+        "not-included",
+        "case-insensitive",
+        "multiple-patterns",
+        "directory-pattern",
     ],
 )
 def test_should_process_inclusion(include, exclude, path, result, pyproject_path):
@@ -59,6 +146,11 @@ def test_evaluate_string(temp_engine):
     assert result == "Success!"
 
 
+def test_comment_slot(temp_engine):
+    result = temp_engine.evaluate_string("# ${'production = true'}\n#${ unclosed")
+    assert result == "production = true\n#${ unclosed"
+
+
 def test_line_disable(temp_engine):
     result = temp_engine.evaluate_string(
         """
@@ -82,17 +174,45 @@ def test_line_delete(temp_engine):
     assert temp_engine.evaluate_string("production = false # templating: delete") == ""
 
 
+@pytest.mark.parametrize(
+    "data, result",
+    [
+        ("a\nb # templating: delete", "a"),
+        ("a\r\nb # templating: delete", "a"),
+        ("a\n# templating: off", "a"),
+        ("a\nb # templating: delete\n", "a\n"),
+    ],
+    ids=["delete", "crlf", "toggle", "terminated"],
+)
+def test_line_directive_last(data, result, temp_engine):
+    assert temp_engine.evaluate_string(data) == result
+
+
 @pytest.mark.parametrize("symbol", ["'", '"'])
 def test_literal_contruct(symbol, temp_engine):
     result = temp_engine.evaluate_string("${" + symbol + "Success!" + symbol + "}")
     assert result == "Success!"
 
 
+def test_literal_construct_nested(temp_engine):
+    result = temp_engine.evaluate_string('${"v${pyproject.tool.poetry.version}-dev"}')
+    assert result == "v1.2.3-dev"
+
+
 def test_pyproject_construct_value(temp_engine):
     result = temp_engine.evaluate_string("${pyproject.tool.poetry.version}")
     assert result == "1.2.3"
 
 
+def test_pyproject_construct_static(temp_engine):
+    temp_engine.evaluate_string("${pyproject.tool.poetry.version}")
+    assert temp_engine.static_slots == {"pyproject.tool.poetry.version": "1.2.3"}
+
+    temp_engine.pyproject.data["tool"]["poetry"]["version"] = "3.2.1"
+    result = temp_engine.evaluate_string("${pyproject.tool.poetry.version}")
+    assert result == "1.2.3"
+
+
 def test_pyproject_construct_everything(temp_engine):
     result = temp_engine.evaluate_string("${pyproject}")
     assert result == str(temp_engine.pyproject.data)
@@ -104,12 +224,8 @@ def test_file_construct_absolute(temp_engine):
 
 
 def test_file_construct_relative_fail(temp_engine):
-    try:
+    with pytest.raises(EvaluationError):
         temp_engine.evaluate_string("${./pyproject.toml}")
-    except EvaluationError:
-        pass
-    else:
-        raise AssertionError("Expected exception was not raised.")
 
 
 def test_file_construct_relative(temp_engine):
@@ -118,13 +234,24 @@ def test_file_construct_relative(temp_engine):
     assert result == "Success!"
 
 
-def test_file_construct_not_found(temp_engine):
-    try:
-        temp_engine.evaluate_string("${/nonexistent.txt}")
-    except EvaluationError:
-        pass
-    else:
-        raise AssertionError("Expected exception was not raised.")
+def test_file_construct_repeated(temp_engine):
+    result = temp_engine.evaluate_string("${/example/__init__.py}\n${/example/__init__.py}")
+    assert result == "Success!\nSuccess!"
+
+
+def test_file_construct_circular(temp_engine):
+    path = os.path.join(temp_engine.root, "example", "__init__.py")
+    with open(path, "w") as f:
+        f.write("${./__init__.py}")
+
+    with pytest.raises(EvaluationError, match="Circular inclusion"):
+        temp_engine.evaluate_and_replace()
+
+
+@pytest.mark.parametrize("path", ["/nonexistent.txt", "/example"])
+def test_file_construct_not_found(path, temp_engine):
+    with pytest.raises(EvaluationError):
+        temp_engine.evaluate_string("${" + path + "}")
 
 
 def test_environ_construct_everything(temp_engine):
@@ -132,29 +259,59 @@ def test_environ_construct_everything(temp_engine):
     assert result == str(dict(os.environ))
 
 
-def test_environ_construct(temp_engine):
+def test_environ_construct(temp_engine, monkeypatch):
     k, v = uuid.uuid4().hex, uuid.uuid4().hex
-    os.environ[k] = v
+    monkeypatch.setenv(k, v)
+
+    result = temp_engine.evaluate_string("${env." + k + "}")
+    assert result == v
+
+
+def test_environ_construct_static(temp_engine, monkeypatch):
+    monkeypatch.setenv("TEMPLATING_TEST", "1.2.3")
+    temp_engine.evaluate_string("${env.TEMPLATING_TEST}")
+
+    monkeypatch.setenv("TEMPLATING_TEST", "3.2.1")
+    assert temp_engine.evaluate_string("${env.TEMPLATING_TEST}") == "1.2.3"
+
+
+def test_environ_construct_fail(temp_engine):
+    with pytest.raises(EvaluationError):
+        temp_engine.evaluate_string("${env.nonexistent}")
+
+
+@pytest.mark.parametrize(
+    "pattern, content",
+    [
+        (re.compile("^custom$"), "custom"),
+        (re.compile("^custom$", re.IGNORECASE), "CUSTOM"),
+        (re.compile(r"(a|b)-\1"), "a-a"),
+    ],
+    ids=["plain", "flags", "backreference"],
+)
+def test_custom_construct(pattern, content, temp_engine):
+    construct = Construct(pattern, lambda m, ctx: "Success!")
     try:
-        result = temp_engine.evaluate_string("${env." + k + "}")
-        assert result == v
+        assert temp_engine.evaluate_string("${" + content + "}") == "Success!"
     finally:
-        os.environ.pop(k)
+        Construct.constructs.remove(construct)
 
 
-def test_environ_construct_fail(temp_engine):
+def test_custom_construct_initials(temp_engine):
+    skipped = Construct(re.compile(".+"), lambda m, ctx: "Failure!", initials="x")
+    matched = Construct(re.compile(".+"), lambda m, ctx: "Success!", initials="c")
     try:
-        temp_engine.evaluate_string("${env.nonexistent}")
-    except EvaluationError:
-        pass
-    else:
-        raise AssertionError("Expected exception was not raised.")
+        assert temp_engine.evaluate_string("${custom}") == "Success!"
+    finally:
+        Construct.constructs.remove(skipped)
+        Construct.constructs.remove(matched)
+
+
+def test_error_line(temp_engine):
+    with pytest.raises(EvaluationError, match="Line 2"):
+        temp_engine.evaluate_string("${'a'}\n# templating: delete\n${nonexistent}")
 
 
 def test_construct_not_found(temp_engine):
-    try:
+    with pytest.raises(EvaluationError):
         temp_engine.evaluate_string("${nonexistent}")
-    except EvaluationError:
-        pass
-    else:
-        raise AssertionError("Expected exception was not raised.")
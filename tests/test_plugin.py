@@ -3,7 +3,6 @@ import re
 import shutil
 import sys
 import tempfile
-import time
 from io import StringIO
 from pathlib import Path
 from zipfile import ZipFile
@@ -12,7 +11,6 @@ import pytest
 from cleo.io.inputs.argv_input import ArgvInput
 from cleo.io.io import IO
 from cleo.io.outputs.stream_output import StreamOutput
-from poetry.console.application import Application
 from poetry.console.application import Application as PoetryApplication
 from poetry.console.commands.build import BuildCommand
 from poetry.factory import Factory
@@ -20,9 +18,14 @@ from poetry.utils.env import EnvManager, VirtualEnv
 from poetry_templating.plugin import EvaluateCommand, TemplatingPlugin, progress
 from poetry_templating.util import Mixin
 
+from tests.conftest import create_project
 
-@pytest.fixture
+RE_PROGRESS = re.compile(r"\r\x1b\[2KTesting\.\.\. <debug>\(\d+\.\d+s\)")
+
+
+@pytest.fixture(scope="session")
 def tmp_venv():
+    # Building a virtual environment is slow and no test modifies it, so one is shared
     with tempfile.TemporaryDirectory() as tmpdir:
         venv_path = Path(tmpdir)
         EnvManager.build_venv(venv_path)
@@ -38,6 +41,38 @@ def basic_io():
     return IO(ArgvInput([]), StreamOutput(sys.stdout), StreamOutput(sys.stderr))
 
 
+@pytest.fixture(scope="session")
+def poetry_app():
+    # Plugins are loaded on the first run, then reused by later runs
+    application = PoetryApplication()
+    application.auto_exits(False)
+    return application
+
+
+@pytest.fixture(scope="session")
+def built_wheel(tmp_path_factory, tmp_venv):
+    # Building is slow, so build tests share the wheel of a single project
+    project_path = str(tmp_path_factory.mktemp("build"))
+    create_project(project_path)
+
+    poetry = Factory().create_poetry(project_path)
+    command = BuildCommand()
+    command._poetry = poetry
+    command._env = tmp_venv
+
+    plugin = TemplatingPlugin()
+    plugin.root = Path(project_path)
+    plugin.poetry = poetry
+
+    io = IO(ArgvInput([]), StreamOutput(sys.stdout), StreamOutput(sys.stderr))
+    io.input._definition = command.definition
+
+    plugin.setup_build(command)
+    command.execute(io)
+
+    return os.path.join(project_path, "dist", "example-1.2.3-py3-none-any.whl")
+
+
 def test_evaluate_command(project_path, basic_io):
     poetry = Factory().create_poetry(project_path)
     command = EvaluateCommand()
@@ -45,61 +80,41 @@ def test_evaluate_command(project_path, basic_io):
 
     command.execute(basic_io)
 
-    with open(os.path.join(project_path, "example", "__init__.py"), "r") as f:
-        assert f.read() == "Success!"
+    assert (Path(project_path) / "example" / "__init__.py").read_text() == "Success!"
 
 
-def test_decorated_progress():
+def test_decorated_progress(monkeypatch):
     buffer = StringIO()
-    os.environ["NO_COLOR"] = "1"
+    monkeypatch.setenv("NO_COLOR", "1")
     output = StreamOutput(buffer)
     io = IO(ArgvInput([]), output, output)
-    os.environ.pop("NO_COLOR")
+    monkeypatch.delenv("NO_COLOR")
 
     io.decorated()
     with progress(io, "Testing..."):
-        time.sleep(1)
-
-    assert (
-        re.search("\r\x1b\\[2KTesting... <debug>\\(\\d+\\.\\d+s\\)", buffer.getvalue())
-        is not None
-    )
-
-
-def test_build_templating(project_path, basic_io, tmp_venv):
-    poetry = Factory().create_poetry(project_path)
-    command = BuildCommand()
-    command._poetry = poetry
-    command._env = tmp_venv
+        pass
 
-    plugin = TemplatingPlugin()
-    plugin.root = Path(project_path)
-    plugin.poetry = poetry
+    assert RE_PROGRESS.search(buffer.getvalue()) is not None
 
-    basic_io.input._definition = command.definition
 
-    plugin.setup_build(command)
-    command.execute(basic_io)
-
-    artefact = os.path.join(project_path, "dist", "example-1.2.3-py3-none-any.whl")
-    with ZipFile(artefact).open("example/__init__.py") as f:
-        assert f.read().decode("utf-8") == "Success!"
+@pytest.mark.slow
+def test_build_templating(built_wheel):
+    with ZipFile(built_wheel) as wheel:
+        assert wheel.read("example/__init__.py") == b"Success!"
 
 
-def test_help():
+def test_help(poetry_app, monkeypatch):
     buffer = StringIO()
-    os.environ["NO_COLOR"] = "1"
+    monkeypatch.setenv("NO_COLOR", "1")
     output = StreamOutput(buffer)
-    os.environ.pop("NO_COLOR")
-    application = PoetryApplication()
-    application.auto_exits(False)
-    application.run(ArgvInput(["", "help", "templating evaluate"]), output, output)
+    monkeypatch.delenv("NO_COLOR")
+    poetry_app.run(ArgvInput(["", "help", "templating evaluate"]), output, output)
 
     expected = "Description:\n  " + EvaluateCommand.description
     assert buffer.getvalue().strip().startswith(expected)
 
 
-def test_setup_build():
+def test_setup_build(poetry_app):
     executed = False
 
     @Mixin.mixin(TemplatingPlugin, "setup_build")
@@ -112,19 +127,17 @@ def test_setup_build():
         return
 
     with plugin_mixin, command_mixin:
-        application = PoetryApplication()
-        application.auto_exits(False)
-        application.run(ArgvInput(["", "build"]))
+        poetry_app.run(ArgvInput(["", "build"]))
 
     assert executed
 
 
-def test_no_pyproject(basic_io, tmp_venv):
+def test_no_pyproject():
     with tempfile.TemporaryDirectory() as tmpdir:
         old_cwd = os.getcwd()
         os.chdir(tmpdir)
         try:
-            TemplatingPlugin().activate(Application())
+            TemplatingPlugin().activate(PoetryApplication())
         except RuntimeError:
             raise
         except Exception:
@@ -5,8 +5,10 @@ import pytest
 from poetry.core.pyproject.toml import PyProjectTOML
 from poetry_templating.util import (
     Mixin,
+    compile_globs,
     get_configuration,
     get_listable,
+    glob_suffixes,
     matches_any,
     relative,
     traverse,
@@ -66,12 +68,29 @@ def test_mixin_context(mixin_pair):
         ("test.py", ["*.png", "test.py"]),
         ("src/test.PY", ["*.py"]),
         ("src/test.py", ["/*.py"]),
+        ("lib/src/test.py", ["src/*.py"]),
+        ("src/test.py", ["t?st.py"]),
+        ("src/test.py", ["[st]est.py"]),
+        ("src/a[b.py", ["a[[]b.py"]),
+        ("src/test.py", compile_globs(["*.png", "*.py"])),
         pytest.param(
             "src\\test.py",
             ["src/test.py"],
             marks=pytest.mark.skipif(os.name != "nt", reason="posix"),
         ),
     ],
+    ids=[
+        "suffix",
+        "second-pattern",
+        "case-insensitive",
+        "leading-slash",
+        "trailing-components",
+        "single-char",
+        "char-class",
+        "bracket-class",
+        "compiled",
+        "windows-separator",
+    ],
 )
 def test_glob_matches(path, patterns):
     assert matches_any(path, patterns)
@@ -82,6 +101,20 @@ def test_glob_matches(path, patterns):
     [
         ("src/test.pyi", ["*.py"]),
         ("not_test.py", ["test.py"]),
+        ("src/sub/test.py", ["src/*.py"]),
+        ("src/test.py", ["[!t]est.py"]),
+        ("src/test.py", []),
+        ("z.py", ["[z-a].py"]),
+        ("src/a/b.py", ["a[!]]b.py"]),
+    ],
+    ids=[
+        "suffix",
+        "partial-name",
+        "extra-component",
+        "negated-class",
+        "empty",
+        "reversed-range",
+        "negated-separator",
     ],
 )
 def test_glob_not_matches(path, patterns):
@@ -93,6 +126,21 @@ def test_get_listable(dictionary):
     assert get_listable(dictionary, "key", ["success"]) == ["success"]
 
 
+@pytest.mark.parametrize(
+    "patterns, expected",
+    [
+        (["*.py"], (".py",)),
+        (["*.PY", "/*.tar.gz"], (".py", ".tar.gz")),
+        ([], ()),
+        (["*.py", "test.py"], None),
+        (["*.p?"], None),
+        (["src/*.py"], None),
+    ],
+)
+def test_glob_suffixes(patterns, expected):
+    assert glob_suffixes(patterns) == expected
+
+
 # test traverse
 
 
@@ -125,12 +173,8 @@ def test_traverse(path, expected, demo_structure):
     ],
 )
 def test_traverse_errors(path, error, demo_structure):
-    try:
+    with pytest.raises(error):
         traverse(demo_structure, path)
-    except Exception as e:
-        assert isinstance(e, error)
-    else:
-        assert False
 
 
 # test get_configuration
@@ -139,40 +183,30 @@ def test_traverse_errors(path, error, demo_structure):
 def test_get_configuration_present(pyproject_path):
     with open(pyproject_path, "a") as f:
         f.write("\n[tool.poetry-templating]\nsuccessful = true")
-        f.flush()
 
     pyproject = PyProjectTOML(Path(pyproject_path))
     assert get_configuration(pyproject) == {"successful": True}
 
 
-def test_get_configuration_missing(pyproject_path):
-    pyproject = PyProjectTOML(Path(pyproject_path))
+def test_get_configuration_missing(readonly_pyproject_path):
+    pyproject = PyProjectTOML(Path(readonly_pyproject_path))
     assert get_configuration(pyproject) == {}
 
 
 def test_get_configuration_missing_tool(temp_file):
     pyproject = PyProjectTOML(Path(temp_file[1]))
 
-    try:
+    with pytest.raises(TypeError):
         get_configuration(pyproject)
-    except Exception as e:
-        assert isinstance(e, TypeError)
-    else:
-        assert False
 
 
 def test_get_configuration_type_mismatch(pyproject_path):
     with open(pyproject_path, "a") as f:
         f.write("\n[tool]\npoetry-templating = true")
-        f.flush()
 
     pyproject = PyProjectTOML(Path(pyproject_path))
-    try:
+    with pytest.raises(TypeError):
         get_configuration(pyproject)
-    except Exception as e:
-        assert isinstance(e, TypeError)
-    else:
-        assert False
 
 
 # test relative
@@ -189,10 +223,10 @@ def test_get_configuration_type_mismatch(pyproject_path):
 def test_relative(path, expected):
     path = Path(path).resolve().as_posix()
     root = Path("/top/root").resolve().as_posix()
-    assert relative(path, root).as_posix() == expected
+    assert Path(relative(path, root)).as_posix() == expected
 
 
 def test_relative_absolute():
     root = Path("/top/root").resolve().as_posix()
     expected = Path("/diff/root").resolve().as_posix()
-    assert relative(expected, root).as_posix() == expected
+    assert Path(relative(expected, root)).as_posix() == expected